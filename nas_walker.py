@@ -6,15 +6,223 @@ NAS目录遍历工具
 """
 
 import os
+import re
+import fnmatch
+import asyncio
 import json
 import configparser
+from array import array
 import logging
+import logging.handlers
+import atexit
+import queue
+from collections import deque
+import shelve
+import shlex
+import threading
+from contextlib import contextmanager
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple, Union
 import paramiko
 import stat
 
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库json
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖，用于更快地构造和序列化文件项
+    msgspec = None
+
+try:
+    import asyncssh
+except ImportError:  # 可选依赖，仅 SCAN.use_async 需要
+    asyncssh = None
+
+
+# get_system_info 中分隔 uname 与 df 输出的标记
+_SYSINFO_SEPARATOR = "---DFSPLIT---"
+
+# 输出文件缓冲区大小
+_OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Markdown报告开头（标题、扫描时间、系统信息）
+_MD_REPORT_TEMPLATE = (
+    "# NAS目录结构报告\n\n"
+    "**扫描时间**: {scan_time}\n\n"
+    "{system_section}"
+    "## 目录结构\n\n"
+)
+
+_MD_SYSTEM_TEMPLATE = (
+    "## 系统信息\n\n"
+    "**操作系统**: {system}\n\n"
+    "### 磁盘使用情况\n\n"
+    "```\n"
+    "{disk_usage}"
+    "\n```\n\n"
+)
+
+# 各级目录标题前缀（下标为标题级别）
+_MD_HEADING_MARKERS = ["#" * level + " 📁 " for level in range(7)]
+
+# Markdown目录表格的表头
+_MD_TABLE_HEADER = (
+    "| 类型 | 名称 | 大小 | 修改时间 | 权限 |\n"
+    "|------|------|------|----------|------|\n"
+)
+
+# 权限字符串缓存（权限位只有512种取值）
+_PERM_CACHE: Dict[int, str] = {}
+
+
+@lru_cache(maxsize=4096)
+def _format_mtime(mtime: int) -> str:
+    """将修改时间戳格式化为ISO格式字符串（同一时间戳的文件常常成批出现）"""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(mtime))
+
+
+def _format_perm(mode: int) -> str:
+    """将st_mode格式化为三位八进制权限字符串"""
+    perm = mode & 0o777
+    text = _PERM_CACHE.get(perm)
+    if text is None:
+        text = _PERM_CACHE[perm] = format(perm, "03o")
+    return text
+
+
+# 目录子项类型（列式存储中的 kinds 取值）
+_KIND_FILE = 0
+_KIND_DIR = 1
+_KIND_ERROR = 2
+
+# 目录节点中保存子项的字段，输出目录本身的信息时需排除
+_ENTRY_KEYS = frozenset(("items", "names", "kinds", "sizes", "mtimes", "modes", "uids", "gids", "children"))
+
+
+if msgspec is not None:
+    class FileEntry(msgspec.Struct):
+        """文件项（C实现的定长结构，比字典更省内存、构造更快）"""
+        type: str
+        name: str
+        path: str
+        size: int
+        mtime: int
+        mode: int
+        owner: int
+        group: int
+
+        def __getitem__(self, key: str) -> Any:
+            return getattr(self, key)
+
+        def get(self, key: str, default: Any = None) -> Any:
+            return getattr(self, key, default)
+
+    _new_file_entry = FileEntry
+else:
+    def _new_file_entry(type: str, name: str, path: str, size: int, mtime: int,
+                        mode: int, owner: int, group: int) -> Dict[str, Any]:
+        """构造文件项字典"""
+        return {
+            "type": type,
+            "name": name,
+            "path": path,
+            "size": size,
+            "mtime": mtime,
+            "mode": mode,
+            "owner": owner,
+            "group": group
+        }
+
+
+def _iter_entries(node: Dict[str, Any]) -> Iterator[Any]:
+    """
+    按原始顺序逐个生成目录节点的子项
+
+    兼容 items 列表形式的节点；列式节点中的文件项在此时才临时构造
+    （安装了msgspec时为 FileEntry，否则为字典，两者都支持按键取值）。
+    文件项的 mtime 和 mode 保持原始整数，只在文本和Markdown输出时格式化。
+    """
+    items = node.get("items")
+    if items is not None:
+        yield from items
+        return
+        
+    path = node["path"]
+    prefix = path if path.endswith('/') else path + '/'
+    children = iter(node["children"])
+    for name, kind, size, mtime, mode, uid, gid in zip(
+            node["names"], node["kinds"], node["sizes"], node["mtimes"],
+            node["modes"], node["uids"], node["gids"]):
+        if kind != _KIND_FILE:
+            yield next(children)
+            continue
+        yield _new_file_entry("file", name, prefix + name, size, mtime, mode, uid, gid)
+
+
+def _is_expanded(item: Dict[str, Any]) -> bool:
+    """判断子项是否为已展开（含子项）的目录节点"""
+    return item.get("type") == "directory" and ("names" in item or "items" in item)
+
+
+if msgspec is not None:
+    # msgspec可直接编码 FileEntry
+    _dumps_json = msgspec.json.Encoder().encode
+elif orjson is not None:
+    _dumps_json = orjson.dumps
+else:
+    def _dumps_json(obj: Any) -> bytes:
+        """将对象序列化为UTF-8编码的JSON"""
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _to_sftp_attributes(entry) -> paramiko.SFTPAttributes:
+    """将asyncssh的目录项转换为paramiko的SFTPAttributes"""
+    attrs = entry.attrs
+    result = paramiko.SFTPAttributes()
+    result.filename = entry.filename
+    result.st_size = attrs.size
+    result.st_uid = attrs.uid
+    result.st_gid = attrs.gid
+    result.st_mode = attrs.permissions
+    result.st_mtime = attrs.mtime
+    return result
+
+
+# find -printf 中 %y 输出的文件类型与st_mode类型位的对应关系
+_FIND_TYPE_BITS = {
+    'f': stat.S_IFREG,
+    'd': stat.S_IFDIR,
+    'l': stat.S_IFLNK,
+    'b': stat.S_IFBLK,
+    'c': stat.S_IFCHR,
+    'p': stat.S_IFIFO,
+    's': stat.S_IFSOCK,
+}
+
+
+def _entry_modified(item: Any) -> str:
+    """文件项的修改时间字符串（兼容已格式化的 modified 字段）"""
+    mtime = item.get("mtime")
+    return _format_mtime(mtime) if mtime is not None else item.get("modified", "未知")
+
+
+def _entry_permissions(item: Any) -> str:
+    """文件项的权限字符串（兼容已格式化的 permissions 字段）"""
+    mode = item.get("mode")
+    return _format_perm(mode) if mode is not None else item.get("permissions", "000")
+
+
+def _format_size(size: int) -> str:
+    """将文件大小格式化为Markdown中显示的字符串"""
+    return f"{size / (1024 * 1024):.2f} MB" if size > 0 else "0 B"
+
 
 class NASWalker:
     """NAS目录遍历器"""
@@ -30,21 +238,78 @@ class NASWalker:
         self.config = None
         self.ssh_client = None
         self.sftp_client = None
+        # SFTP通道池（同一SSH连接上的多个SFTP通道）
+        self._sftp_pool: Optional[queue.Queue] = None
+        self._sftp_channels: List[paramiko.SFTPClient] = []
+        # 待扫描子目录在父目录列举中得到的属性（绝对路径 -> SFTPAttributes），
+        # 供目录缓存校验mtime时代替一次stat；目录被扫描后即移除
+        self._attr_cache: Dict[str, paramiko.SFTPAttributes] = {}
+        # 本地持久化的目录列举缓存（路径 -> (目录mtime, 过滤规则, 目录节点)）
+        self._cache: Optional[shelve.Shelf] = None
+        self._cache_lock = threading.Lock()
+        # 排除规则（由 SCAN.exclude_globs 编译而成的正则）
+        self._exclude_globs: List[str] = []
+        self._exclude: Optional[re.Pattern] = None
+        # 后台日志线程（仅由本实例配置日志时存在）
+        self._log_handler: Optional[logging.Handler] = None
+        self._log_listener: Optional[logging.handlers.QueueListener] = None
         self.setup_logging()
         self.load_config()
         
     def setup_logging(self):
-        """设置日志配置"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('nas_walker.log', encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        """
+        设置日志配置
+
+        日志记录经 QueueHandler 放入队列，由后台 QueueListener 线程统一写入文件和控制台，
+        扫描线程记录日志时不必等待格式化和I/O。
+        """
         self.logger = logging.getLogger(__name__)
         
+        root = logging.getLogger()
+        if root.handlers:
+            # 与 logging.basicConfig 一致：已配置过时不再重复添加
+            return
+            
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handlers = [
+            logging.FileHandler('nas_walker.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            
+        log_queue = queue.SimpleQueue()
+        self._log_handler = logging.handlers.QueueHandler(log_queue)
+        root.setLevel(logging.INFO)
+        root.addHandler(self._log_handler)
+        
+        self._log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+        self._log_listener.start()
+        # 未调用 run_scan 时也要在退出前写完队列中的日志
+        atexit.register(self._stop_logging)
+        
+    def _flush_logging(self):
+        """写完队列中已有的日志，日志线程随即重新启动，之后的日志照常记录"""
+        listener = self._log_listener
+        if listener is None:
+            return
+            
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+        listener.start()
+        
+    def _stop_logging(self):
+        """停止后台日志线程，写完队列中剩余的日志并关闭日志文件"""
+        listener, self._log_listener = self._log_listener, None
+        if listener is None:
+            return
+            
+        listener.stop()
+        logging.getLogger().removeHandler(self._log_handler)
+        for handler in listener.handlers:
+            handler.close()
+        
     def load_config(self):
         """加载配置文件"""
         try:
@@ -60,12 +325,53 @@ class NASWalker:
                 if section not in self.config:
                     raise ValueError(f"配置文件缺少必要的 [{section}] 部分")
                     
+            self._load_settings()
+                    
             self.logger.info("配置文件加载成功")
             
         except Exception as e:
             self.logger.error(f"加载配置文件失败: {e}")
             raise
             
+    def _load_settings(self):
+        """将常用配置项解析为属性，避免在扫描过程中反复查询和转换configparser的值"""
+        server = self.config['NAS_SERVER']
+        connection = self.config['CONNECTION']
+        scan = self.config['SCAN']
+        
+        self.ip: str = server['ip']
+        self.username: str = server['username']
+        self.password: str = server['password']
+        self.port: int = connection.getint('port')
+        self.timeout: int = connection.getint('timeout')
+        self.max_sessions: int = connection.getint('max_sessions', fallback=10)
+        self.keepalive: int = connection.getint('keepalive', fallback=30)
+        self.sftp_window: int = connection.getint('sftp_window', fallback=4194304)
+        self.sftp_max_packet: int = connection.getint('sftp_max_packet', fallback=1048576)
+        
+        self.root_path: str = scan['root_path']
+        self.max_depth: int = scan.getint('max_depth')
+        self.include_hidden: bool = scan.getboolean('include_hidden', fallback=False)
+        self.max_workers: int = scan.getint('max_workers', fallback=8)
+        self.output_format: str = scan['output_format'].lower()
+        self.output_file: str = scan['output_file']
+        self.stream_output: bool = scan.getboolean('stream_output', fallback=False)
+        self.use_cache: bool = scan.getboolean('use_cache', fallback=False)
+        self.cache_file: str = scan.get('cache_file', fallback='nas_walker.cache')
+        self.use_find: bool = scan.getboolean('use_find', fallback=False)
+        self.use_async: bool = scan.getboolean('use_async', fallback=False)
+        self.async_concurrency: int = scan.getint('async_concurrency', fallback=64)
+        
+        # 将排除规则合并编译为一个正则，每个目录项只需匹配一次
+        self._exclude_globs = [
+            pattern.strip()
+            for pattern in scan.get('exclude_globs', fallback='').split(',')
+            if pattern.strip()
+        ]
+        self._exclude = re.compile(
+            '|'.join(fnmatch.translate(pattern) for pattern in self._exclude_globs)
+        ) if self._exclude_globs else None
+
     def create_default_config(self):
         """创建默认配置文件"""
         config = configparser.ConfigParser()
@@ -79,13 +385,25 @@ class NASWalker:
         config['CONNECTION'] = {
             'protocol': 'ssh',
             'port': '22',
-            'timeout': '30'
+            'timeout': '30',
+            'max_sessions': '10',
+            'keepalive': '30',
+            'sftp_window': '4194304',
+            'sftp_max_packet': '1048576'
         }
         
         config['SCAN'] = {
             'root_path': '/home',
             'max_depth': '10',
             'include_hidden': 'false',
+            'max_workers': '8',
+            'exclude_globs': '',
+            'stream_output': 'false',
+            'use_cache': 'false',
+            'cache_file': 'nas_walker.cache',
+            'use_find': 'false',
+            'use_async': 'false',
+            'async_concurrency': '64',
             'output_format': 'json',
             'output_file': 'nas_structure.json'
         }
@@ -95,20 +413,21 @@ class NASWalker:
             
         self.logger.info(f"已创建默认配置文件: {self.config_file}")
         
-    def connect_to_nas(self) -> bool:
+    def connect_to_nas(self, open_sftp: bool = True) -> bool:
         """
         连接到NAS服务器
         
+        Args:
+            open_sftp: 是否同时打开SFTP客户端及通道池（异步扫描使用独立的asyncssh连接，
+                只需要执行远程命令的会话）
+            
         Returns:
             bool: 连接是否成功
         """
         try:
             # 获取连接参数
-            ip = self.config['NAS_SERVER']['ip']
-            username = self.config['NAS_SERVER']['username']
-            password = self.config['NAS_SERVER']['password']
-            port = int(self.config['CONNECTION']['port'])
-            timeout = int(self.config['CONNECTION']['timeout'])
+            ip = self.ip
+            port = self.port
             
             # 创建SSH客户端
             self.ssh_client = paramiko.SSHClient()
@@ -118,15 +437,21 @@ class NASWalker:
             self.ssh_client.connect(
                 hostname=ip,
                 port=port,
-                username=username,
-                password=password,
-                timeout=timeout,
+                username=self.username,
+                password=self.password,
+                timeout=self.timeout,
                 allow_agent=False,
                 look_for_keys=False
             )
             
-            # 创建SFTP客户端
-            self.sftp_client = self.ssh_client.open_sftp()
+            # 长时间扫描期间定期发送keepalive，防止空闲断开
+            if self.keepalive > 0:
+                self.ssh_client.get_transport().set_keepalive(self.keepalive)
+            
+            # 创建SFTP客户端及通道池
+            if open_sftp:
+                self.sftp_client = self._open_sftp()
+                self._open_sftp_pool()
             
             self.logger.info(f"成功连接到NAS服务器: {ip}:{port}")
             return True
@@ -135,113 +460,655 @@ class NASWalker:
             self.logger.error(f"连接NAS服务器失败: {e}")
             return False
             
-    def scan_directory(self, remote_path: str, max_depth: int = 10, current_depth: int = 0) -> Dict[str, Any]:
+    def _open_sftp(self) -> paramiko.SFTPClient:
         """
-        递归扫描目录结构
+        打开一个SFTP通道
+
+        使用配置的窗口和数据包大小（默认值适合高延迟链路），并为通道设置超时。
+
+        Returns:
+            paramiko.SFTPClient: SFTP客户端
+        """
+        sftp = paramiko.SFTPClient.from_transport(
+            self.ssh_client.get_transport(),
+            window_size=self.sftp_window,
+            max_packet_size=self.sftp_max_packet
+        )
+        sftp.get_channel().settimeout(self.timeout)
+        return sftp
+
+    def _open_sftp_pool(self):
+        """
+        在同一SSH连接上打开多个SFTP通道供工作线程复用
+
+        主SFTP客户端作为第一个通道，通道数为 max_workers 与 max_sessions-1 中的
+        较小值（留一个会话给 get_system_info 和 find 快速扫描的 exec_command）。
+        """
+        pool_size = max(1, min(self.max_workers, self.max_sessions - 1))
         
+        self._sftp_pool = queue.Queue()
+        if self.sftp_client is not None:
+            self._sftp_channels.append(self.sftp_client)
+            self._sftp_pool.put(self.sftp_client)
+            
+        while len(self._sftp_channels) < pool_size:
+            try:
+                sftp = self._open_sftp()
+            except Exception as e:
+                if not self._sftp_channels:
+                    raise
+                # 超过服务器会话上限等情况，使用已打开的通道继续
+                self.logger.warning(f"无法打开更多SFTP通道: {e}")
+                break
+            self._sftp_channels.append(sftp)
+            self._sftp_pool.put(sftp)
+            
+        self.logger.info(f"SFTP通道池大小: {self._sftp_pool.qsize()}")
+
+    def _pool_size(self) -> int:
+        """SFTP通道池大小，即可并发执行的目录列举数"""
+        return max(1, len(self._sftp_channels))
+
+    @contextmanager
+    def _borrow_sftp(self):
+        """从通道池借出一个SFTP通道，使用完毕后归还"""
+        if self._sftp_pool is None:
+            self._open_sftp_pool()
+        sftp = self._sftp_pool.get()
+        try:
+            yield sftp
+        finally:
+            self._sftp_pool.put(sftp)
+
+    def _close_sftp_pool(self):
+        """关闭通道池中的所有SFTP通道（包括主SFTP客户端）"""
+        channels, self._sftp_channels = self._sftp_channels, []
+        self._sftp_pool = None
+        for sftp in channels:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+
+    def _list_directory(self, sftp: paramiko.SFTPClient, remote_path: str):
+        """
+        列出目录内容
+
+        优先使用 listdir_iter 预读多个 READDIR 请求，避免逐批等待往返；
+        旧版 paramiko 不支持时退回 listdir_attr。列举错误在迭代时抛出。
+        listdir_iter 直接读取 READDIR 响应，不会从 _expecting 中移除对应的请求号，
+        通道池中的通道在整个扫描期间复用，列举结束后需手动清理。
+
         Args:
+            sftp: SFTP客户端
             remote_path: 远程目录路径
+
+        Returns:
+            Iterable[paramiko.SFTPAttributes]: 目录项属性
+        """
+        listdir_iter = getattr(sftp, "listdir_iter", None)
+        if listdir_iter is None:
+            if not getattr(self, "_warned_listdir_iter", False):
+                self._warned_listdir_iter = True
+                self.logger.warning("当前paramiko版本不支持listdir_iter，将使用listdir_attr")
+            yield from sftp.listdir_attr(remote_path)
+            return
+        first_request = getattr(sftp, "request_number", None)
+        try:
+            yield from listdir_iter(remote_path, read_aheads=50)
+        finally:
+            expecting = getattr(sftp, "_expecting", None)
+            if first_request is not None and expecting is not None:
+                # 通道同一时间只被一个线程借用，这些请求号都属于本次列举
+                for num in range(first_request, sftp.request_number):
+                    expecting.pop(num, None)
+
+    def _scan_one(self, remote_path: str, current_depth: int, max_depth: int):
+        """
+        借用通道池中的SFTP通道扫描单个目录（不递归）
+
+        Args:
+            remote_path: 远程目录路径
+            current_depth: 当前扫描深度
             max_depth: 最大扫描深度
+
+        Returns:
+            tuple: (目录结果, 待扫描子目录列表[(在children中的下标, 路径)])
+        """
+        with self._borrow_sftp() as sftp:
+            return self._read_directory(sftp, remote_path, current_depth, max_depth)
+
+    def _open_cache(self):
+        """按配置打开本地目录缓存"""
+        if not self.use_cache:
+            return
+        cache_file = self.cache_file
+        try:
+            self._cache = shelve.open(cache_file)
+            self.logger.info(f"已启用目录缓存: {cache_file}")
+        except Exception as e:
+            self.logger.warning(f"无法打开目录缓存，将不使用缓存: {e}")
+
+    def _close_cache(self):
+        """关闭本地目录缓存"""
+        if self._cache is not None:
+            try:
+                self._cache.close()
+            except Exception:
+                pass
+            self._cache = None
+
+    def _filter_fingerprint(self) -> tuple:
+        """返回影响目录列举结果的过滤规则，写入缓存以便规则变化时使其失效"""
+        return (self.include_hidden, tuple(self._exclude_globs))
+
+    def _load_cached_directory(self, sftp: paramiko.SFTPClient, remote_path: str,
+                               current_depth: int, max_depth: int):
+        """
+        查询目录缓存
+
+        目录的mtime只在其直接子项增删或改名时变化，mtime不变即可复用缓存的列举结果，
+        用一次stat代替完整的目录列举；子目录仍各自按自己的mtime校验。
+        缓存的是过滤后的结果，过滤规则与写入时不同也视为未命中。
+
+        Args:
+            sftp: SFTP客户端
+            remote_path: 远程目录路径
             current_depth: 当前扫描深度
-            
+            max_depth: 最大扫描深度
+
         Returns:
-            Dict: 目录结构信息
+            tuple: (目录当前mtime, 命中时为 (目录结果, 待扫描子目录列表)，否则为None)
         """
-        if current_depth > max_depth:
-            return {"type": "directory", "name": os.path.basename(remote_path), "truncated": True}
-            
         try:
-            # 获取目录内容
-            items = self.sftp_client.listdir_attr(remote_path)
+            attrs = self._attr_cache.pop(remote_path, None) or sftp.stat(remote_path)
+            mtime = int(attrs.st_mtime)
+            with self._cache_lock:
+                cached = self._cache.get(remote_path)
+        except Exception:
+            # 交给正常的目录列举处理错误
+            return None, None
+            
+        if cached is None or cached[:2] != (mtime, self._filter_fingerprint()):
+            return mtime, None
             
+        # 扫描时间为本次校验的时间，并按本次扫描深度重新生成子目录占位项
+        result = cached[2]
+        result["scan_time"] = datetime.now().isoformat()
+        children = result["children"]
+        subdirs = []
+        for index, child in enumerate(children):
+            if child["type"] != "directory":
+                continue
+            if current_depth < max_depth:
+                subdirs.append((index, child["path"]))
+                children[index] = {"type": "directory", "name": child["name"], "path": child["path"]}
+            else:
+                children[index] = {"type": "directory", "name": child["name"], "path": child["path"], "truncated": True}
+        return mtime, (result, subdirs)
+
+    def _read_directory(self, sftp: paramiko.SFTPClient, remote_path: str, current_depth: int, max_depth: int):
+        """
+        扫描单个目录（不递归）
+
+        Args:
+            sftp: SFTP客户端
+            remote_path: 远程目录路径
+            current_depth: 当前扫描深度
+            max_depth: 最大扫描深度
+
+        Returns:
+            tuple: (目录结果, 待扫描子目录列表[(在children中的下标, 路径)])
+        """
+        mtime = None
+        if self._cache is not None:
+            mtime, cached = self._load_cached_directory(sftp, remote_path, current_depth, max_depth)
+            if cached is not None:
+                return cached
+                
+        # 获取目录内容（逐项读取，不预先生成完整列表）
+        items = self._list_directory(sftp, remote_path)
+        result, subdirs = self._build_directory(remote_path, items, current_depth, max_depth)
+        
+        if mtime is not None and result["type"] == "directory":
+            # 此时子目录仍是占位项，写入缓存的只是本目录的列举结果
+            with self._cache_lock:
+                self._cache[remote_path] = (mtime, self._filter_fingerprint(), result)
+        return result, subdirs
+
+    def _build_directory(self, remote_path: str, items: Iterable[paramiko.SFTPAttributes],
+                         current_depth: int, max_depth: int):
+        """
+        根据目录项构造目录节点（不递归）
+
+        Args:
+            remote_path: 远程目录路径
+            items: 目录项属性，迭代过程中出现的列举错误会转为错误节点
+            current_depth: 当前扫描深度
+            max_depth: 最大扫描深度
+
+        Returns:
+            tuple: (目录结果, 待扫描子目录列表[(在children中的下标, 路径)])
+        """
+        subdirs = []
+        # 该目录已在扫描，不再需要其暂存的属性
+        self._attr_cache.pop(remote_path, None)
+        # SFTP路径总是POSIX格式，直接做字符串拼接
+        name = remote_path.rsplit('/', 1)[-1] or '/'
+        prefix = remote_path if remote_path.endswith('/') else remote_path + '/'
+        
+        try:
             result = {
                 "type": "directory",
-                "name": os.path.basename(remote_path) or "/",
+                "name": name,
                 "path": remote_path,
-                "items": [],
                 "item_count": 0,
-                "scan_time": datetime.now().isoformat()
+                "scan_time": datetime.now().isoformat(),
+                # 子项按列存储，children 依次保存目录和错误项
+                "names": [],
+                "kinds": bytearray(),
+                "sizes": array('q'),
+                "mtimes": array('q'),
+                "modes": array('I'),
+                "uids": array('I'),
+                "gids": array('I'),
+                "children": []
             }
+            names = result["names"]
+            kinds = result["kinds"]
+            sizes = result["sizes"]
+            mtimes = result["mtimes"]
+            modes = result["modes"]
+            uids = result["uids"]
+            gids = result["gids"]
+            children = result["children"]
+            exclude = self._exclude
+            include_hidden = self.include_hidden
+            # 只有启用目录缓存时才需要暂存子目录属性
+            attr_cache = self._attr_cache if self._cache is not None else None
             
             # 扫描子项
             for item in items:
-                if item.filename in ['.', '..']:
+                filename = item.filename
+                if filename[0] == '.' and (not include_hidden or filename in ('.', '..')):
+                    continue
+                if exclude is not None and exclude.match(filename):
+                    # 被排除的目录不会再向下扫描
                     continue
                     
-                item_path = os.path.join(remote_path, item.filename)
-                
+                item_path = prefix + filename
                 try:
+                    mode = item.st_mode or 0
+                    row = (int(item.st_size or 0), int(item.st_mtime or 0), mode, item.st_uid or 0, item.st_gid or 0)
+                    
                     # 检查是否为目录
-                    if stat.S_ISDIR(item.st_mode):
+                    if stat.S_ISDIR(mode):
+                        kind = _KIND_DIR
                         if current_depth < max_depth:
-                            sub_result = self.scan_directory(item_path, max_depth, current_depth + 1)
-                            result["items"].append(sub_result)
+                            # 先放入占位项，子目录扫描完成后替换；
+                            # 其属性暂存到该子目录被扫描为止
+                            if attr_cache is not None:
+                                attr_cache[item_path] = item
+                            subdirs.append((len(children), item_path))
+                            children.append({
+                                "type": "directory",
+                                "name": filename,
+                                "path": item_path
+                            })
                         else:
-                            result["items"].append({
+                            children.append({
                                 "type": "directory",
-                                "name": item.filename,
+                                "name": filename,
                                 "path": item_path,
                                 "truncated": True
                             })
                     else:
-                        # 获取文件信息
-                        file_info = {
-                            "type": "file",
-                            "name": item.filename,
-                            "path": item_path,
-                            "size": item.st_size,
-                            "modified": datetime.fromtimestamp(item.st_mtime).isoformat(),
-                            "permissions": oct(item.st_mode)[-3:],
-                            "owner": item.st_uid,
-                            "group": item.st_gid
-                        }
-                        result["items"].append(file_info)
+                        kind = _KIND_FILE
                         
                 except PermissionError:
                     # 权限不足
-                    result["items"].append({
+                    row = (0, 0, 0, 0, 0)
+                    kind = _KIND_ERROR
+                    children.append({
                         "type": "error",
-                        "name": item.filename,
+                        "name": filename,
                         "path": item_path,
                         "error": "权限不足"
                     })
                 except Exception as e:
                     # 其他错误
-                    result["items"].append({
+                    row = (0, 0, 0, 0, 0)
+                    kind = _KIND_ERROR
+                    children.append({
                         "type": "error",
-                        "name": item.filename,
+                        "name": filename,
                         "path": item_path,
                         "error": str(e)
                     })
                     
-            result["item_count"] = len(result["items"])
-            return result
+                names.append(filename)
+                kinds.append(kind)
+                sizes.append(row[0])
+                mtimes.append(row[1])
+                modes.append(row[2])
+                uids.append(row[3])
+                gids.append(row[4])
+                    
+            result["item_count"] = len(kinds)
+            return result, subdirs
             
         except PermissionError:
             return {
                 "type": "error",
-                "name": os.path.basename(remote_path),
+                "name": name,
                 "path": remote_path,
                 "error": "权限不足"
-            }
+            }, []
         except Exception as e:
             return {
                 "type": "error",
-                "name": os.path.basename(remote_path),
+                "name": name,
                 "path": remote_path,
                 "error": str(e)
-            }
+            }, []
+
+    def scan_directory(self, remote_path: str, max_depth: int = 10, current_depth: int = 0) -> Dict[str, Any]:
+        """
+        并行扫描目录结构
+
+        以队列按广度优先顺序遍历（不递归），使用线程池并发列出各目录，
+        每个任务从通道池借用一个SFTP通道，结果在主线程中按原有层级拼接。
+        
+        Args:
+            remote_path: 远程目录路径
+            max_depth: 最大扫描深度
+            current_depth: 当前扫描深度
+            
+        Returns:
+            Dict: 目录结构信息
+        """
+        if current_depth > max_depth:
+            return {"type": "directory", "name": remote_path.rsplit('/', 1)[-1] or '/', "truncated": True}
+
+        if self._sftp_pool is None:
+            self._open_sftp_pool()
+        workers = self._pool_size()
+        # 同时提交的任务数上限，其余目录在队列中按广度优先顺序等待
+        max_in_flight = workers * 2
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 待扫描目录: (父目录children列表, 下标, 路径, 深度)
+            jobs = deque([(None, None, remote_path, current_depth)])
+            # future -> (父目录children列表, 下标, 深度)
+            pending = {}
+            result = None
+            
+            while jobs or pending:
+                while jobs and len(pending) < max_in_flight:
+                    parent_children, index, path, depth = jobs.popleft()
+                    future = executor.submit(self._scan_one, path, depth, max_depth)
+                    pending[future] = (parent_children, index, depth)
+                    
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parent_children, index, depth = pending.pop(future)
+                    node, subdirs = future.result()
+                    if parent_children is None:
+                        result = node
+                    else:
+                        parent_children[index] = node
+                        
+                    children = node["children"] if subdirs else None
+                    for sub_index, sub_path in subdirs:
+                        jobs.append((children, sub_index, sub_path, depth + 1))
+                        
+            return result
+
+    async def async_scan_directory(self, sftp, remote_path: str, max_depth: int = 10, current_depth: int = 0,
+                                   sem: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+        """
+        使用asyncssh异步扫描目录结构
+
+        同一连接上并发发出大量目录列举请求，并发数由信号量限制。
+
+        Args:
+            sftp: asyncssh的SFTP客户端
+            remote_path: 远程目录路径
+            max_depth: 最大扫描深度
+            current_depth: 当前扫描深度
+            sem: 限制并发列举数的信号量
+
+        Returns:
+            Dict: 目录结构信息
+        """
+        if sem is None:
+            sem = asyncio.Semaphore(self.async_concurrency)
+            
+        name = remote_path.rsplit('/', 1)[-1] or '/'
+        async with sem:
+            try:
+                names = await sftp.readdir(remote_path)
+            except asyncssh.SFTPPermissionDenied:
+                return {"type": "error", "name": name, "path": remote_path, "error": "权限不足"}
+            except Exception as e:
+                return {"type": "error", "name": name, "path": remote_path, "error": str(e)}
+                
+        result, subdirs = self._build_directory(
+            remote_path, (_to_sftp_attributes(entry) for entry in names), current_depth, max_depth)
+        
+        if subdirs:
+            nodes = await asyncio.gather(*[
+                self.async_scan_directory(sftp, sub_path, max_depth, current_depth + 1, sem)
+                for _, sub_path in subdirs
+            ])
+            children = result["children"]
+            for (index, _), node in zip(subdirs, nodes):
+                children[index] = node
+                
+        return result
+
+    async def _async_scan(self, remote_path: str, max_depth: int) -> Dict[str, Any]:
+        """建立asyncssh连接并执行异步扫描"""
+        async with asyncssh.connect(
+            self.ip,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            known_hosts=None,
+            connect_timeout=self.timeout
+        ) as conn:
+            async with conn.start_sftp_client() as sftp:
+                return await self.async_scan_directory(sftp, remote_path, max_depth)
+
+    def _fast_scan_via_find(self, remote_path: str, max_depth: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        通过远程执行一次 find 获取整个目录树
+
+        服务器端一次遍历即可返回所有条目的属性，避免逐目录的SFTP往返。
+        需要支持 -printf 的GNU find；执行失败时返回None，由调用方退回SFTP扫描。
+        起点为符号链接时与SFTP一样跟随（-H）；无法读取的子目录与SFTP扫描一样
+        记为权限不足的错误节点。
+
+        Args:
+            remote_path: 远程目录路径
+            max_depth: 最大扫描深度
+
+        Returns:
+            Optional[Dict]: 目录结构信息，失败时为None
+        """
+        find_root = remote_path.rstrip('/') or '/'
+        # 排除的条目在服务器端直接剪枝，不进入其子树
+        prune = ""
+        prune_globs = self._exclude_globs if self.include_hidden else self._exclude_globs + ['.*']
+        if prune_globs:
+            names = " -o ".join(f"-name {shlex.quote(pattern)}" for pattern in prune_globs)
+            prune = f"\\( {names} \\) -prune -o "
+        # 无法读取的目录额外输出一行 "!\t路径"
+        command = (
+            f"find -H {shlex.quote(find_root)} -mindepth 1 -maxdepth {max_depth + 1} {prune}"
+            "-printf '%y\\t%s\\t%T@\\t%m\\t%U\\t%G\\t%p\\n' "
+            "-type d ! -readable -printf '!\\t%p\\n' 2>/dev/null"
+        )
+        
+        # 按父目录分组的目录项
+        groups: Dict[str, List[paramiko.SFTPAttributes]] = {}
+        unreadable = set()
+        try:
+            stdin, stdout, stderr = self.ssh_client.exec_command(command)
+            for line in stdout:
+                if line.startswith('!\t'):
+                    unreadable.add(line[2:].rstrip('\n'))
+                    continue
+                fields = line.rstrip('\n').split('\t', 6)
+                if len(fields) != 7:
+                    # 文件名中含换行等无法解析的行
+                    continue
+                file_type, size, mtime, perm, uid, gid, path = fields
+                parent, _, filename = path.rpartition('/')
+                
+                attrs = paramiko.SFTPAttributes()
+                attrs.filename = filename
+                attrs.st_size = int(size)
+                attrs.st_mtime = int(float(mtime))
+                attrs.st_mode = _FIND_TYPE_BITS.get(file_type, 0) | int(perm, 8)
+                attrs.st_uid = int(uid)
+                attrs.st_gid = int(gid)
+                groups.setdefault(parent or '/', []).append(attrs)
+                
+            exit_status = stdout.channel.recv_exit_status()
+        except Exception as e:
+            self.logger.warning(f"find扫描失败，将使用SFTP扫描: {e}")
+            return None
+            
+        if exit_status != 0:
+            if not groups:
+                self.logger.warning(f"find扫描失败（退出状态 {exit_status}），将使用SFTP扫描")
+                return None
+            # 部分目录无权限等情况，已获取的结果仍然可用
+            self.logger.warning(f"find扫描部分失败（退出状态 {exit_status}），结果可能不完整")
+            
+        # 按层级组装目录树
+        result, subdirs = self._build_directory(remote_path, groups.pop(find_root, ()), 0, max_depth)
+        pending = [(result, subdirs, 0)]
+        while pending:
+            node, subdirs, depth = pending.pop()
+            children = node["children"]
+            for index, sub_path in subdirs:
+                if sub_path in unreadable:
+                    self._attr_cache.pop(sub_path, None)
+                    children[index] = {
+                        "type": "error",
+                        "name": sub_path.rsplit('/', 1)[-1],
+                        "path": sub_path,
+                        "error": "权限不足"
+                    }
+                    continue
+                child, child_subdirs = self._build_directory(sub_path, groups.pop(sub_path, ()), depth + 1, max_depth)
+                children[index] = child
+                pending.append((child, child_subdirs, depth + 1))
+                
+        return result
+
+    def iter_scan(self, remote_path: str, max_depth: int = 10,
+                  extra: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式扫描目录结构
+
+        按深度优先顺序产生扫描事件，已输出的子树不会保留在内存中，
+        内存占用与目录深度（及单层宽度）成正比。接下来要输出的子目录会按
+        输出顺序提前提交到线程池中并发列举，同时预读的目录数有上限。
+
+        事件格式为 (类型, 节点)：
+            ("open", 目录节点)  - 进入目录，节点中包含该目录的直接子项
+            ("item", 子项)      - 文件、错误或被截断的目录
+            ("close", 目录节点) - 离开目录
+
+        Args:
+            remote_path: 远程目录路径
+            max_depth: 最大扫描深度
+            extra: 附加到根节点的额外字段（如系统信息）
+
+        Yields:
+            Tuple[str, Dict]: 扫描事件
+        """
+        if self._sftp_pool is None:
+            self._open_sftp_pool()
+        workers = self._pool_size()
+        # 已提交但尚未输出的目录数上限，预读结果占用的内存不随目录宽度增长
+        max_in_flight = workers * 2
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 待扫描子目录按输出顺序（深度优先）排队: (占位项id, 路径, 深度)
+            jobs = deque()
+            # 占位项id -> future
+            futures = {}
+            
+            def enqueue(node, subdirs, depth):
+                # 子目录排在尚未输出的兄弟目录之前
+                children = node["children"]
+                jobs.extendleft((id(children[index]), sub_path, depth) for index, sub_path in reversed(subdirs))
+                
+            def submit():
+                while jobs and len(futures) < max_in_flight:
+                    key, sub_path, depth = jobs.popleft()
+                    futures[key] = executor.submit(self._scan_one, sub_path, depth, max_depth)
+                    
+            try:
+                root, subdirs = self._scan_one(remote_path, 0, max_depth)
+                if extra:
+                    root.update(extra)
+                if root["type"] != "directory":
+                    yield "item", root
+                    return
+                    
+                yield "open", root
+                enqueue(root, subdirs, 1)
+                submit()
+                stack = [(root, _iter_entries(root))]
+                
+                while stack:
+                    node, items = stack[-1]
+                    for item in items:
+                        key = id(item)
+                        if jobs and jobs[0][0] == key:
+                            # 预读已满时，下一个要输出的目录可能尚未提交
+                            _, sub_path, depth = jobs.popleft()
+                            futures[key] = executor.submit(self._scan_one, sub_path, depth, max_depth)
+                        future = futures.pop(key, None)
+                        if future is None:
+                            yield "item", item
+                            continue
+                            
+                        child, child_subdirs = future.result()
+                        if child["type"] != "directory":
+                            submit()
+                            yield "item", child
+                            continue
+                            
+                        depth = len(stack)
+                        enqueue(child, child_subdirs, depth + 1)
+                        submit()
+                        yield "open", child
+                        stack.append((child, _iter_entries(child)))
+                        break
+                    else:
+                        stack.pop()
+                        yield "close", node
+            finally:
+                # 提前结束（如写入失败）时不再等待排队中的列举
+                for future in futures.values():
+                    future.cancel()
             
     def get_system_info(self) -> Dict[str, str]:
         """获取系统信息"""
         try:
-            # 获取系统信息
-            stdin, stdout, stderr = self.ssh_client.exec_command('uname -a')
-            system_info = stdout.read().decode().strip()
-            
-            # 获取磁盘使用情况
-            stdin, stdout, stderr = self.ssh_client.exec_command('df -h')
-            disk_info = stdout.read().decode().strip()
+            # 在同一个通道中获取系统信息和磁盘使用情况
+            stdin, stdout, stderr = self.ssh_client.exec_command(
+                f'uname -a; echo "{_SYSINFO_SEPARATOR}"; df -h'
+            )
+            system_info, _, disk_info = stdout.read().decode().partition(_SYSINFO_SEPARATOR)
+            system_info = system_info.strip()
+            disk_info = disk_info.strip()
             
             return {
                 "system": system_info,
@@ -251,12 +1118,13 @@ class NASWalker:
             self.logger.warning(f"无法获取系统信息: {e}")
             return {}
             
-    def save_results(self, data: Dict[str, Any], output_file: str = None) -> bool:
+    def save_results(self, data: Union[Dict[str, Any], Iterable[Tuple[str, Dict[str, Any]]]],
+                     output_file: str = None) -> bool:
         """
         保存扫描结果到文件
         
         Args:
-            data: 扫描结果数据
+            data: 扫描结果数据，或 iter_scan 产生的扫描事件流
             output_file: 输出文件名
             
         Returns:
@@ -264,19 +1132,21 @@ class NASWalker:
         """
         try:
             if output_file is None:
-                output_file = self.config['SCAN']['output_file']
+                output_file = self.output_file
                 
-            output_format = self.config['SCAN']['output_format'].lower()
+            output_format = self.output_format
+            events = self._tree_events(data) if isinstance(data, dict) else data
             
             if output_format == 'json':
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                # JSON直接以UTF-8字节写入
+                with open(output_file, 'wb', buffering=_OUTPUT_BUFFER_SIZE) as f:
+                    self._write_json_format(events, f)
             elif output_format == 'txt':
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    self._write_text_format(data, f)
+                with open(output_file, 'w', encoding='utf-8', buffering=_OUTPUT_BUFFER_SIZE) as f:
+                    self._write_text_format(events, f)
             elif output_format == 'md':
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    self._write_markdown_format(data, f)
+                with open(output_file, 'w', encoding='utf-8', buffering=_OUTPUT_BUFFER_SIZE) as f:
+                    self._write_markdown_format(events, f)
             else:
                 raise ValueError(f"不支持的输出格式: {output_format}")
                 
@@ -286,85 +1156,157 @@ class NASWalker:
         except Exception as e:
             self.logger.error(f"保存结果失败: {e}")
             return False
+
+    def _tree_events(self, data: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """将已构建的目录树转换为与 iter_scan 相同的事件流"""
+        if not _is_expanded(data):
+            yield "item", data
+            return
             
-    def _write_text_format(self, data: Dict[str, Any], file_handle, indent: int = 0):
-        """将数据写入文本格式"""
-        prefix = "  " * indent
-        
-        if data["type"] == "directory":
-            file_handle.write(f"{prefix}[DIR] {data['name']}\n")
-            if "items" in data and data["items"]:
-                for item in data["items"]:
-                    self._write_text_format(item, file_handle, indent + 1)
-        elif data["type"] == "file":
-            size_mb = data.get("size", 0) / (1024 * 1024)
-            file_handle.write(f"{prefix}[FILE] {data['name']} ({size_mb:.2f} MB)\n")
-        elif data["type"] == "error":
-            file_handle.write(f"{prefix}[ERROR] {data['name']} - {data.get('error', '未知错误')}\n")
-            
-    def _write_markdown_format(self, data: Dict[str, Any], file_handle, indent: int = 0):
-        """将数据写入Markdown格式"""
-        if indent == 0:
-            # 写入文档标题和系统信息
-            file_handle.write(f"# NAS目录结构报告\n\n")
-            file_handle.write(f"**扫描时间**: {data.get('scan_time', '未知')}\n\n")
-            
-            if "system_info" in data:
-                sys_info = data["system_info"]
-                file_handle.write("## 系统信息\n\n")
-                file_handle.write(f"**操作系统**: {sys_info.get('system', '未知')}\n\n")
-                file_handle.write("### 磁盘使用情况\n\n")
-                file_handle.write("```\n")
-                file_handle.write(sys_info.get('disk_usage', '未知'))
-                file_handle.write("\n```\n\n")
-            
-            file_handle.write("## 目录结构\n\n")
-        
-        # 根据类型写入不同的Markdown格式
-        if data["type"] == "directory":
-            # 目录使用标题格式
-            heading_level = min(indent + 2, 6)  # 限制标题级别为2-6
-            heading_marker = "#" * heading_level
-            file_handle.write(f"{heading_marker} 📁 {data['name']}\n\n")
+        yield "open", data
+        stack = [(data, _iter_entries(data))]
+        while stack:
+            node, items = stack[-1]
+            for item in items:
+                if _is_expanded(item):
+                    yield "open", item
+                    stack.append((item, _iter_entries(item)))
+                    break
+                yield "item", item
+            else:
+                stack.pop()
+                yield "close", node
+
+    def _write_json_format(self, events: Iterable[Tuple[str, Dict[str, Any]]], file_handle):
+        """将事件流逐项写入JSON格式（file_handle 为二进制文件）"""
+        dumps = _dumps_json
+        # 每层目录是否尚未写入任何子项
+        first_flags = []
+        
+        for event, node in events:
+            if event == "close":
+                first_flags.pop()
+                file_handle.write(b"\n]}")
+                continue
+                
+            if first_flags:
+                file_handle.write(b"\n" if first_flags[-1] else b",\n")
+                first_flags[-1] = False
+                
+            if event == "open":
+                header = {key: value for key, value in node.items() if key not in _ENTRY_KEYS}
+                file_handle.write(dumps(header)[:-1])
+                file_handle.write(b', "items": [')
+                first_flags.append(True)
+            else:
+                file_handle.write(dumps(node))
+                
+        file_handle.write(b"\n")
+            
+    def _write_text_format(self, events: Iterable[Tuple[str, Dict[str, Any]]], file_handle):
+        """将事件流写入文本格式"""
+        indent = 0
+        
+        for event, data in events:
+            prefix = "  " * indent
+            if event == "open":
+                file_handle.write(f"{prefix}[DIR] {data['name']}\n")
+                indent += 1
+            elif event == "close":
+                indent -= 1
+            elif data["type"] == "directory":
+                file_handle.write(f"{prefix}[DIR] {data['name']}\n")
+            elif data["type"] == "file":
+                size_mb = data.get("size", 0) / (1024 * 1024)
+                file_handle.write(f"{prefix}[FILE] {data['name']} ({size_mb:.2f} MB)\n")
+            elif data["type"] == "error":
+                file_handle.write(f"{prefix}[ERROR] {data['name']} - {data.get('error', '未知错误')}\n")
+            
+    def _write_markdown_header(self, data: Dict[str, Any], file_handle):
+        """写入Markdown文档标题和系统信息"""
+        sys_info = data.get("system_info")
+        system_section = _MD_SYSTEM_TEMPLATE.format(
+            system=sys_info.get('system', '未知'),
+            disk_usage=sys_info.get('disk_usage', '未知')
+        ) if sys_info is not None else ""
+        
+        file_handle.write(_MD_REPORT_TEMPLATE.format(
+            scan_time=data.get('scan_time', '未知'),
+            system_section=system_section
+        ))
             
-            if "items" in data and data["items"]:
-                # 创建目录内容表格
-                file_handle.write("| 类型 | 名称 | 大小 | 修改时间 | 权限 |\n")
-                file_handle.write("|------|------|------|----------|------|\n")
+    def _write_markdown_format(self, events: Iterable[Tuple[str, Dict[str, Any]]], file_handle):
+        """将事件流写入Markdown格式"""
+        indent = 0
+        # 表格中列为目录、但尚未输出其内容的子目录路径；流式扫描时其列举
+        # 可能在表格写出之后才失败
+        listed_dirs = set()
+        
+        for event, data in events:
+            if event == "close":
+                indent -= 1
+                continue
                 
-                for item in data["items"]:
-                    if item["type"] == "file":
-                        size_mb = item.get("size", 0) / (1024 * 1024)
-                        size_str = f"{size_mb:.2f} MB" if size_mb > 0 else "0 B"
-                        file_handle.write(f"| 📄 文件 | {item['name']} | {size_str} | {item.get('modified', '未知')} | {item.get('permissions', '000')} |\n")
-                    elif item["type"] == "directory":
-                        file_handle.write(f"| 📁 目录 | {item['name']} | - | - | - |\n")
-                    elif item["type"] == "error":
-                        file_handle.write(f"| ❌ 错误 | {item['name']} | - | - | {item.get('error', '未知错误')} |\n")
+            if event == "item":
+                # 子项已在所属目录的表格中列出，只有根节点本身不是目录、
+                # 或表格中的子目录列举失败时单独输出
+                if indent == 0:
+                    self._write_markdown_header(data, file_handle)
+                    self._write_markdown_entry(data, file_handle)
+                elif data["type"] == "error" and data["path"] in listed_dirs:
+                    listed_dirs.discard(data["path"])
+                    self._write_markdown_entry(data, file_handle)
+                continue
                 
-                file_handle.write("\n")
+            if indent == 0:
+                self._write_markdown_header(data, file_handle)
+            else:
+                listed_dirs.discard(data["path"])
                 
-                # 递归处理子目录
-                for item in data["items"]:
-                    if item["type"] == "directory" and "items" in item:
-                        self._write_markdown_format(item, file_handle, indent + 1)
+            # 目录使用标题格式，标题与内容表格一次写入
+            heading_level = min(indent + 2, 6)  # 限制标题级别为2-6
+            rows = [_MD_HEADING_MARKERS[heading_level], data['name'], "\n\n", _MD_TABLE_HEADER]
+            append = rows.append
+            indent += 1
+            
+            for item in _iter_entries(data):
+                item_type = item["type"]
+                if item_type == "file":
+                    append(f"| 📄 文件 | {item['name']} | {_format_size(item.get('size', 0))} | {_entry_modified(item)} | {_entry_permissions(item)} |\n")
+                elif item_type == "directory":
+                    append(f"| 📁 目录 | {item['name']} | - | - | - |\n")
+                    if not item.get("truncated"):
+                        listed_dirs.add(item["path"])
+                elif item_type == "error":
+                    append(f"| ❌ 错误 | {item['name']} | - | - | {item.get('error', '未知错误')} |\n")
+            
+            if len(rows) > 4:
+                append("\n")
+            else:
+                # 空目录不输出表格
+                rows.pop()
+            file_handle.write("".join(rows))
                         
-        elif data["type"] == "file":
+    def _write_markdown_entry(self, data: Dict[str, Any], file_handle):
+        """将单个文件或错误项写入Markdown格式"""
+        if data["type"] == "file":
             # 文件信息
-            size_mb = data.get("size", 0) / (1024 * 1024)
-            size_str = f"{size_mb:.2f} MB" if size_mb > 0 else "0 B"
-            file_handle.write(f"- **📄 {data['name']}** ({size_str})\n")
-            file_handle.write(f"  - 路径: `{data['path']}`\n")
-            file_handle.write(f"  - 修改时间: {data.get('modified', '未知')}\n")
-            file_handle.write(f"  - 权限: {data.get('permissions', '000')}\n")
-            file_handle.write(f"  - 所有者: {data.get('owner', '未知')}\n")
-            file_handle.write(f"  - 组: {data.get('group', '未知')}\n\n")
+            file_handle.write(
+                f"- **📄 {data['name']}** ({_format_size(data.get('size', 0))})\n"
+                f"  - 路径: `{data['path']}`\n"
+                f"  - 修改时间: {_entry_modified(data)}\n"
+                f"  - 权限: {_entry_permissions(data)}\n"
+                f"  - 所有者: {data.get('owner', '未知')}\n"
+                f"  - 组: {data.get('group', '未知')}\n\n"
+            )
             
         elif data["type"] == "error":
             # 错误信息
-            file_handle.write(f"- **❌ {data['name']}**\n")
-            file_handle.write(f"  - 路径: `{data['path']}`\n")
-            file_handle.write(f"  - 错误: {data.get('error', '未知错误')}\n\n")
+            file_handle.write(
+                f"- **❌ {data['name']}**\n"
+                f"  - 路径: `{data['path']}`\n"
+                f"  - 错误: {data.get('error', '未知错误')}\n\n"
+            )
             
     def run_scan(self) -> bool:
         """
@@ -376,13 +1318,19 @@ class NASWalker:
         try:
             self.logger.info("开始NAS目录扫描...")
             
-            # 连接NAS
-            if not self.connect_to_nas():
+            use_async = self.use_async
+            if use_async and asyncssh is None:
+                self.logger.warning("未安装asyncssh，将使用paramiko扫描")
+                use_async = False
+                
+            # 连接NAS（异步扫描时不需要paramiko的SFTP通道）
+            if not self.connect_to_nas(open_sftp=self.stream_output or not use_async):
                 return False
+            self._open_cache()
                 
             # 获取扫描参数
-            root_path = self.config['SCAN']['root_path']
-            max_depth = int(self.config['SCAN']['max_depth'])
+            root_path = self.root_path
+            max_depth = self.max_depth
             
             # 执行扫描
             self.logger.info(f"开始扫描目录: {root_path}, 最大深度: {max_depth}")
@@ -392,11 +1340,26 @@ class NASWalker:
             if system_info:
                 self.logger.info(f"系统信息: {system_info.get('system', '未知')}")
             
-            result = self.scan_directory(root_path, max_depth)
-            
-            # 添加系统信息到结果中
-            if system_info:
-                result["system_info"] = system_info
+            if self.stream_output:
+                # 流式扫描：边扫描边写入，不在内存中保留完整目录树
+                if self.use_find or use_async:
+                    self.logger.warning("流式输出只支持SFTP逐目录扫描，将忽略 use_find/use_async 设置")
+                extra = {"system_info": system_info} if system_info else None
+                result = self.iter_scan(root_path, max_depth, extra)
+            else:
+                result = None
+                if self.use_find:
+                    result = self._fast_scan_via_find(root_path, max_depth)
+                    
+                if result is None:
+                    if use_async:
+                        result = asyncio.run(self._async_scan(root_path, max_depth))
+                    else:
+                        result = self.scan_directory(root_path, max_depth)
+                
+                # 添加系统信息到结果中
+                if system_info:
+                    result["system_info"] = system_info
             
             # 保存结果
             if self.save_results(result):
@@ -410,6 +1373,9 @@ class NASWalker:
             return False
         finally:
             # 清理连接
+            self._attr_cache.clear()
+            self._close_cache()
+            self._close_sftp_pool()
             if self.sftp_client:
                 try:
                     self.sftp_client.close()
@@ -420,6 +1386,7 @@ class NASWalker:
                     self.ssh_client.close()
                 except:
                     pass
+            self._flush_logging()
 
 
 def main():
@@ -431,7 +1398,7 @@ def main():
         # 执行扫描
         if walker.run_scan():
             print("✅ NAS目录扫描完成！")
-            print(f"📁 结果已保存到: {walker.config['SCAN']['output_file']}")
+            print(f"📁 结果已保存到: {walker.output_file}")
         else:
             print("❌ NAS目录扫描失败！")
             print("请检查配置文件、网络连接和权限设置")
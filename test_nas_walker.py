@@ -8,6 +8,12 @@ NAS目录遍历器测试脚本
 import os
 import sys
 import json
+import shlex
+import shutil
+import tempfile
+import stat
+from array import array
+import paramiko
 from nas_walker import NASWalker
 
 
@@ -91,6 +97,7 @@ def test_output_formats():
         }
         
         # 测试JSON格式
+        walker.output_format = 'json'
         json_file = "test_output.json"
         if walker.save_results(test_data, json_file):
             print("✅ JSON格式输出测试成功")
@@ -100,7 +107,7 @@ def test_output_formats():
             return False
             
         # 测试TXT格式
-        walker.config['SCAN']['output_format'] = 'txt'
+        walker.output_format = 'txt'
         txt_file = "test_output.txt"
         if walker.save_results(test_data, txt_file):
             print("✅ TXT格式输出测试成功")
@@ -109,6 +116,34 @@ def test_output_formats():
             print("❌ TXT格式输出测试失败")
             return False
             
+        # 测试Markdown格式
+        walker.output_format = 'md'
+        md_file = "test_output.md"
+        if walker.save_results(test_data, md_file):
+            with open(md_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            os.remove(md_file)
+            if "## 📁 test" not in content or "| 📄 文件 | test.txt | 0.00 MB |" not in content:
+                print("❌ Markdown格式输出内容不正确")
+                return False
+        else:
+            print("❌ Markdown格式输出测试失败")
+            return False
+            
+        # 根节点不是目录时单独输出该项
+        error_data = {"type": "error", "name": "test", "path": "/test", "error": "权限不足"}
+        if walker.save_results(error_data, md_file):
+            with open(md_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            os.remove(md_file)
+            if "- **❌ test**" not in content or "  - 错误: 权限不足" not in content:
+                print("❌ Markdown格式错误项输出不正确")
+                return False
+        else:
+            print("❌ Markdown格式输出测试失败")
+            return False
+            
+        print("✅ Markdown格式输出测试成功")
         return True
         
     except Exception as e:
@@ -116,6 +151,551 @@ def test_output_formats():
         return False
 
 
+def test_streaming_output():
+    """测试事件流输出功能"""
+    print("\n🧪 测试事件流输出功能...")
+    
+    try:
+        walker = NASWalker()
+        walker.output_format = 'json'
+        
+        # 模拟 iter_scan 产生的事件
+        sub_dir = {"type": "directory", "name": "sub", "path": "/test/sub", "items": [], "item_count": 0}
+        root_dir = {
+            "type": "directory",
+            "name": "test",
+            "path": "/test",
+            "items": [{"type": "directory", "name": "sub", "path": "/test/sub"}],
+            "item_count": 2
+        }
+        file_item = {"type": "file", "name": "a.txt", "path": "/test/a.txt", "size": 10}
+        events = [
+            ("open", root_dir),
+            ("open", sub_dir),
+            ("close", sub_dir),
+            ("item", file_item),
+            ("close", root_dir)
+        ]
+        
+        json_file = "test_stream_output.json"
+        if not walker.save_results(iter(events), json_file):
+            print("❌ 事件流JSON输出失败")
+            return False
+            
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        os.remove(json_file)
+        
+        if [item["name"] for item in data["items"]] != ["sub", "a.txt"] or data["items"][0]["items"] != []:
+            print("❌ 事件流JSON结构不正确")
+            return False
+            
+        print("✅ 事件流JSON输出测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 事件流输出测试失败: {e}")
+        return False
+
+
+def test_columnar_output():
+    """测试列式目录节点的输出"""
+    print("\n🧪 测试列式目录节点输出...")
+    
+    try:
+        walker = NASWalker()
+        walker.output_format = 'json'
+        
+        # 与 scan_directory 结果相同的列式结构：一个文件和一个被截断的目录
+        test_data = {
+            "type": "directory",
+            "name": "test",
+            "path": "/test",
+            "item_count": 2,
+            "names": ["a.txt", "sub"],
+            "kinds": bytearray([0, 1]),
+            "sizes": array('q', [2048, 0]),
+            "mtimes": array('q', [0, 0]),
+            "modes": array('I', [0o100644, 0o40755]),
+            "uids": array('I', [1000, 1000]),
+            "gids": array('I', [100, 100]),
+            "children": [{"type": "directory", "name": "sub", "path": "/test/sub", "truncated": True}]
+        }
+        
+        json_file = "test_columnar_output.json"
+        if not walker.save_results(test_data, json_file):
+            print("❌ 列式节点JSON输出失败")
+            return False
+            
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        os.remove(json_file)
+        
+        file_item, dir_item = data["items"]
+        if "names" in data or file_item["path"] != "/test/a.txt" or file_item["mode"] != 0o100644 or not dir_item.get("truncated"):
+            print("❌ 列式节点JSON结构不正确")
+            return False
+            
+        print("✅ 列式节点输出测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 列式节点输出测试失败: {e}")
+        return False
+
+
+def test_exclude_globs():
+    """测试排除规则解析"""
+    print("\n🧪 测试排除规则解析...")
+    
+    test_config = "test_exclude_config.ini"
+    
+    try:
+        walker = NASWalker()
+        walker.config['SCAN']['exclude_globs'] = 'node_modules, *.tmp ,.git'
+        with open(test_config, 'w', encoding='utf-8') as f:
+            walker.config.write(f)
+            
+        walker = NASWalker(test_config)
+        excluded = [name for name in ['node_modules', 'a.tmp', '.git', 'src', 'tmp', '.gitignore']
+                    if walker._exclude.match(name)]
+        
+        if excluded != ['node_modules', 'a.tmp', '.git']:
+            print(f"❌ 排除规则匹配不正确: {excluded}")
+            return False
+            
+        print("✅ 排除规则解析测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 排除规则测试失败: {e}")
+        return False
+    finally:
+        if os.path.exists(test_config):
+            os.remove(test_config)
+
+
+# find 快速扫描测试用的目录树：(相对路径, %y类型, 权限, 大小)
+FIND_ENTRIES = [
+    ("docs", "d", "755", 4096),
+    ("a.txt", "f", "644", 10),
+    ("link", "l", "777", 4),
+    ("docs/b.txt", "f", "600", 20),
+    ("docs/sub", "d", "700", 4096),
+    ("docs/sub/c.txt", "f", "644", 30),
+    ("locked", "d", "000", 4096),
+    ("locked/secret.txt", "f", "600", 40),
+]
+# 无法读取的目录（find 不会输出其内容，SFTP 列举时报权限不足）
+FIND_UNREADABLE = {"locked"}
+FIND_TYPE_MODES = {"f": stat.S_IFREG, "d": stat.S_IFDIR, "l": stat.S_IFLNK}
+
+
+class FakeFindOutput:
+    """模拟 exec_command 返回的 stdout（可逐行迭代，带退出状态）"""
+    
+    def __init__(self, lines, exit_status):
+        self.lines = lines
+        self.channel = self
+        self.exit_status = exit_status
+        
+    def __iter__(self):
+        return iter(self.lines)
+        
+    def recv_exit_status(self):
+        return self.exit_status
+
+
+class FakeFindSSH:
+    """模拟执行 find 的SSH客户端，按命令中的起点和 -maxdepth 返回预置条目"""
+    
+    def __init__(self, entries=FIND_ENTRIES, exit_status=0, symlink_roots=()):
+        self.entries = entries
+        self.exit_status = exit_status
+        # 起点为符号链接时，没有 -H 的 find 不进入其中
+        self.symlink_roots = symlink_roots
+        self.commands = []
+        
+    def exec_command(self, command):
+        self.commands.append(command)
+        args = shlex.split(command)
+        follow = args[1] == "-H"
+        root = args[2] if follow else args[1]
+        max_depth = int(args[args.index("-maxdepth") + 1])
+        exit_status = self.exit_status
+        # 无法解析的行应被跳过
+        lines = ["broken line\n"]
+        if root in self.symlink_roots and not follow:
+            return None, FakeFindOutput(lines, exit_status), None
+        for rel_path, file_type, perm, size in self.entries:
+            depth = rel_path.count("/") + 1
+            if depth > max_depth or rel_path.rpartition("/")[0] in FIND_UNREADABLE:
+                continue
+            path = "/" + rel_path if root == "/" else root + "/" + rel_path
+            lines.append(f"{file_type}\t{size}\t1700000000.5\t{perm}\t1000\t100\t{path}\n")
+            if rel_path in FIND_UNREADABLE:
+                lines.append(f"!\t{path}\n")
+                if depth < max_depth:
+                    # 进入无法读取的目录失败
+                    exit_status = 1
+        return None, FakeFindOutput(lines, exit_status), None
+
+
+def build_expected_tree(walker, remote_path, max_depth, entries=FIND_ENTRIES):
+    """用 _build_directory 按相同条目逐层构造期望的目录树"""
+    root = remote_path.rstrip("/")
+    groups = {}
+    for rel_path, file_type, perm, size in entries:
+        parent, _, filename = (root + "/" + rel_path).rpartition("/")
+        attrs = paramiko.SFTPAttributes()
+        attrs.filename = filename
+        attrs.st_size = size
+        attrs.st_mtime = 1700000000
+        attrs.st_mode = FIND_TYPE_MODES[file_type] | int(perm, 8)
+        attrs.st_uid = 1000
+        attrs.st_gid = 100
+        groups.setdefault(parent or "/", []).append(attrs)
+        
+    def list_directory(path):
+        if path[len(root) + 1:] in FIND_UNREADABLE:
+            raise PermissionError(path)
+        yield from groups.get(path.rstrip("/") or "/", [])
+        
+    def build(path, depth):
+        node, subdirs = walker._build_directory(path, list_directory(path), depth, max_depth)
+        for index, sub_path in subdirs:
+            node["children"][index] = build(sub_path, depth + 1)
+        return node
+    return build(remote_path, 0)
+
+
+def strip_scan_time(node):
+    """去掉扫描时间并把列转为列表，便于比较目录树"""
+    result = {}
+    for key, value in node.items():
+        if key == "scan_time":
+            continue
+        if key == "children":
+            value = [strip_scan_time(child) for child in value]
+        elif isinstance(value, (array, bytearray)):
+            value = list(value)
+        result[key] = value
+    return result
+
+
+def test_find_fast_scan():
+    """测试 find 快速扫描的输出解析"""
+    print("\n🧪 测试find快速扫描解析...")
+    
+    try:
+        walker = NASWalker()
+        walker.include_hidden = True
+        walker._exclude_globs = []
+        walker._exclude = None
+        
+        for remote_path in ["/data", "/data/", "/", "/share"]:
+            for max_depth in [0, 1]:
+                walker.ssh_client = FakeFindSSH(symlink_roots={"/share"})
+                result = walker._fast_scan_via_find(remote_path, max_depth)
+                expected = build_expected_tree(walker, remote_path, max_depth)
+                
+                command = walker.ssh_client.commands[0]
+                if f"-maxdepth {max_depth + 1} " not in command:
+                    print(f"❌ find深度参数不正确: {command}")
+                    return False
+                if result is None or strip_scan_time(result) != strip_scan_time(expected):
+                    print(f"❌ find扫描结果与SFTP扫描不一致: {remote_path} max_depth={max_depth}")
+                    return False
+                    
+        # 类型字符转换为对应的文件类型位
+        walker.ssh_client = FakeFindSSH()
+        result = walker._fast_scan_via_find("/data", 1)
+        modes = dict(zip(result["names"], result["modes"]))
+        if modes != {"docs": 0o40755, "a.txt": 0o100644, "link": 0o120777, "locked": 0o40000}:
+            print(f"❌ find类型位转换不正确: {modes}")
+            return False
+            
+        # 部分失败时保留已获取的结果，无任何输出时退回SFTP扫描
+        walker.ssh_client = FakeFindSSH(exit_status=1)
+        if walker._fast_scan_via_find("/data", 1) is None:
+            print("❌ find部分失败时不应丢弃结果")
+            return False
+        walker.ssh_client = FakeFindSSH(entries=[], exit_status=1)
+        if walker._fast_scan_via_find("/data", 1) is not None:
+            print("❌ find失败且无输出时应返回None")
+            return False
+            
+        print("✅ find快速扫描解析测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ find快速扫描测试失败: {e}")
+        return False
+
+
+class FakeCacheSFTP:
+    """模拟SFTP客户端：目录内容和mtime可修改，并记录列举次数"""
+    
+    def __init__(self):
+        self.tree = {
+            "/data": [("a.txt", False), ("b.tmp", False), (".hidden", False), ("sub", True)],
+            "/data/sub": [("c.txt", False)],
+        }
+        self.mtimes = {"/data": 100, "/data/sub": 200}
+        self.listings = []
+        self.stats = []
+        
+    def stat(self, path):
+        self.stats.append(path)
+        attrs = paramiko.SFTPAttributes()
+        attrs.st_mode = stat.S_IFDIR | 0o755
+        attrs.st_mtime = self.mtimes[path]
+        return attrs
+        
+    def listdir_iter(self, path, read_aheads=50):
+        self.listings.append(path)
+        for name, is_dir in self.tree[path]:
+            attrs = paramiko.SFTPAttributes()
+            attrs.filename = name
+            attrs.st_mode = (stat.S_IFDIR | 0o755) if is_dir else (stat.S_IFREG | 0o644)
+            attrs.st_size = 10
+            attrs.st_mtime = 1700000000
+            yield attrs
+
+
+def test_directory_cache():
+    """测试目录列举缓存"""
+    print("\n🧪 测试目录缓存...")
+    
+    cache_dir = tempfile.mkdtemp()
+    walker = None
+    
+    try:
+        walker = NASWalker()
+        walker.config['SCAN']['exclude_globs'] = ''
+        walker._load_settings()
+        cache_file = os.path.join(cache_dir, "test.cache")
+        walker.include_hidden = False
+        walker.use_cache = True
+        walker.cache_file = cache_file
+        walker._open_cache()
+        sftp = FakeCacheSFTP()
+        
+        # 未命中时列举目录，再次读取命中缓存
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 0)
+        first_scan_time = result["scan_time"]
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 0)
+        if sftp.listings != ["/data"] or result["names"] != ["a.txt", "b.tmp", "sub"]:
+            print(f"❌ 缓存未命中: {sftp.listings}")
+            return False
+        if result["scan_time"] == first_scan_time:
+            print("❌ 缓存命中时应更新扫描时间")
+            return False
+        if subdirs or not result["children"][0].get("truncated"):
+            print("❌ 缓存命中时子目录应按深度截断")
+            return False
+            
+        # 更大的深度下重新生成子目录占位项
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 1)
+        if sftp.listings != ["/data"] or subdirs != [(0, "/data/sub")] or "truncated" in result["children"][0]:
+            print(f"❌ 缓存命中时子目录占位项不正确: {subdirs}")
+            return False
+            
+        # 目录mtime变化后重新列举
+        sftp.tree["/data"].append(("d.txt", False))
+        sftp.mtimes["/data"] = 101
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 1)
+        if sftp.listings != ["/data", "/data"] or "d.txt" not in result["names"]:
+            print("❌ 目录mtime变化后缓存应失效")
+            return False
+            
+        # 子目录使用父目录列举中得到的属性校验缓存，不再stat
+        walker._read_directory(sftp, "/data/sub", 1, 1)
+        if "/data/sub" in sftp.stats or walker._attr_cache:
+            print("❌ 子目录应使用父目录列举得到的属性")
+            return False
+            
+        # 过滤规则变化后重新列举
+        walker.config['SCAN']['exclude_globs'] = '*.tmp'
+        walker._load_settings()
+        walker.use_cache = True
+        walker.cache_file = cache_file
+        walker.include_hidden = False
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 0)
+        if len(sftp.listings) != 4 or "b.tmp" in result["names"]:
+            print("❌ 排除规则变化后缓存应失效")
+            return False
+        walker.include_hidden = True
+        result, subdirs = walker._read_directory(sftp, "/data", 0, 0)
+        if len(sftp.listings) != 5 or ".hidden" not in result["names"]:
+            print("❌ include_hidden 变化后缓存应失效")
+            return False
+            
+        # 缓存在重新打开后仍然有效
+        walker._close_cache()
+        walker._open_cache()
+        walker._read_directory(sftp, "/data", 0, 0)
+        if len(sftp.listings) != 5:
+            print("❌ 重新打开后缓存应命中")
+            return False
+            
+        print("✅ 目录缓存测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 目录缓存测试失败: {e}")
+        return False
+    finally:
+        if walker is not None:
+            walker._close_cache()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# 并行/流式扫描测试用的目录树：目录路径 -> [(名称, 大小)]，大小为None表示子目录；
+# 不在其中的目录列举时报权限不足
+SCAN_TREE = {
+    "/nas": [("a.txt", 100), ("docs", None), ("locked", None), ("empty", None), ("z.bin", 2 * 1024 * 1024)],
+    "/nas/docs": [("b.txt", 200), ("sub", None)],
+    "/nas/empty": [],
+    "/nas/docs/sub": [("c.txt", 300), ("deep", None)],
+    "/nas/docs/sub/deep": [],
+}
+
+
+class FakeTreeSFTP:
+    """按 SCAN_TREE 列举目录的模拟SFTP客户端"""
+    
+    def __init__(self):
+        # 与paramiko相同，listdir_iter 读取的 READDIR 请求号留在 _expecting 中
+        self.request_number = 1
+        self._expecting = {}
+        
+    def listdir_iter(self, path, read_aheads=50):
+        for num in range(self.request_number, self.request_number + read_aheads):
+            self._expecting[num] = None
+        self.request_number += read_aheads
+        if path not in SCAN_TREE:
+            raise PermissionError(path)
+        for name, size in SCAN_TREE[path]:
+            attrs = paramiko.SFTPAttributes()
+            attrs.filename = name
+            attrs.st_mode = (stat.S_IFDIR | 0o755) if size is None else (stat.S_IFREG | 0o644)
+            attrs.st_size = size or 0
+            attrs.st_mtime = 1700000000
+            yield attrs
+            
+    def close(self):
+        pass
+
+
+def expected_outline(path, depth, max_depth):
+    """按 SCAN_TREE 生成期望的文本格式输出行"""
+    prefix = "  " * depth
+    name = path.rsplit("/", 1)[-1]
+    if path not in SCAN_TREE:
+        return [f"{prefix}[ERROR] {name} - 权限不足"]
+    lines = [f"{prefix}[DIR] {name}"]
+    for child, size in SCAN_TREE[path]:
+        if size is not None:
+            lines.append(f"{prefix}  [FILE] {child} ({size / (1024 * 1024):.2f} MB)")
+        elif depth < max_depth:
+            lines.extend(expected_outline(path + "/" + child, depth + 1, max_depth))
+        else:
+            lines.append(f"{prefix}  [DIR] {child}")
+    return lines
+
+
+def json_outline(node, depth=0):
+    """将JSON输出转换为与文本格式相同的输出行"""
+    prefix = "  " * depth
+    if node["type"] == "error":
+        return [f"{prefix}[ERROR] {node['name']} - {node['error']}"]
+    if node["type"] == "file":
+        return [f"{prefix}[FILE] {node['name']} ({node['size'] / (1024 * 1024):.2f} MB)"]
+    lines = [f"{prefix}[DIR] {node['name']}"]
+    for item in node.get("items", []):
+        lines.extend(json_outline(item, depth + 1))
+    return lines
+
+
+def expected_headings(path, depth, max_depth):
+    """按 SCAN_TREE 生成期望的Markdown目录标题"""
+    if path not in SCAN_TREE:
+        return []
+    headings = ["#" * min(depth + 2, 6) + " 📁 " + path.rsplit("/", 1)[-1]]
+    if depth < max_depth:
+        for child, size in SCAN_TREE[path]:
+            if size is None:
+                headings.extend(expected_headings(path + "/" + child, depth + 1, max_depth))
+    return headings
+
+
+def test_parallel_scan():
+    """测试并行扫描和流式扫描"""
+    print("\n🧪 测试并行扫描...")
+    
+    output_file = "test_parallel_scan.out"
+    walker = None
+    
+    try:
+        walker = NASWalker()
+        walker.include_hidden = False
+        walker._exclude_globs = []
+        walker._exclude = None
+        walker.sftp_client = FakeTreeSFTP()
+        walker._open_sftp = FakeTreeSFTP
+        
+        # 主SFTP客户端作为通道池的第一个通道，并为远程命令留一个会话
+        walker.max_workers = 8
+        walker.max_sessions = 3
+        walker._open_sftp_pool()
+        if walker._sftp_channels[0] is not walker.sftp_client or walker._pool_size() != 2:
+            print(f"❌ SFTP通道池大小不正确: {walker._pool_size()}")
+            return False
+        walker._close_sftp_pool()
+        walker.max_workers = 2
+        
+        for max_depth in [0, 1, 2, 3]:
+            expected = expected_outline("/nas", 0, max_depth)
+            headings = expected_headings("/nas", 0, max_depth)
+            for mode in ["tree", "stream"]:
+                for output_format in ["json", "txt", "md"]:
+                    walker.output_format = output_format
+                    data = walker.scan_directory("/nas", max_depth) if mode == "tree" else walker.iter_scan("/nas", max_depth)
+                    if not walker.save_results(data, output_file):
+                        print(f"❌ {mode} {output_format} 输出失败")
+                        return False
+                    with open(output_file, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                        
+                    if output_format == "json":
+                        ok = json_outline(json.loads(content)) == expected
+                    elif output_format == "txt":
+                        ok = content.splitlines() == expected
+                    else:
+                        # 无法列举的目录必须以错误形式出现
+                        found = [line for line in content.splitlines() if " 📁 " in line and line.startswith("#")]
+                        ok = found == headings and ("权限不足" in content) == (max_depth > 0)
+                    if not ok:
+                        print(f"❌ {mode} {output_format} 输出与期望不一致 (max_depth={max_depth})")
+                        return False
+                    if any(sftp._expecting for sftp in walker._sftp_channels):
+                        print("❌ 列举后SFTP通道中残留请求号")
+                        return False
+                        
+        print("✅ 并行扫描测试成功")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 并行扫描测试失败: {e}")
+        return False
+    finally:
+        if walker is not None:
+            walker._close_sftp_pool()
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+
 def test_error_handling():
     """测试错误处理功能"""
     print("\n🧪 测试错误处理功能...")
@@ -150,6 +730,12 @@ def main():
         ("配置文件加载", test_config_loading),
         ("默认配置创建", test_config_creation),
         ("输出格式功能", test_output_formats),
+        ("事件流输出", test_streaming_output),
+        ("列式节点输出", test_columnar_output),
+        ("排除规则解析", test_exclude_globs),
+        ("find快速扫描", test_find_fast_scan),
+        ("目录缓存", test_directory_cache),
+        ("并行扫描", test_parallel_scan),
         ("错误处理功能", test_error_handling)
     ]
     